@@ -1,61 +1,137 @@
 import os
-import click
+import sys
+import argparse
+import functools
+import itertools
 import json
+import hashlib
 import logging
+import orjson
+import pickle
+import re
+import shlex
+import shutil
 import subprocess
-from openai import OpenAI
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Protocol
+from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential_jitter
+
+if TYPE_CHECKING:
+    import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows has no fcntl; cache writes are then unlocked
+    fcntl = None
 
 # Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger('git-ai')
 
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# openai is slow to import, so the client is only created when a request needs it
+client = None
+client_lock = threading.Lock()
+
+def get_client():
+    global client
+    with client_lock:
+        if client is None:
+            from openai import OpenAI
+            client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return client
+
+# Client for calls wrapped in with_retries, so its retries are not stacked on the SDK's own
+def get_retrying_client():
+    return get_client().with_options(max_retries=0)
+
+# Rate limits, dropped connections and server errors are worth retrying; bad requests are not
+def is_transient_error(e: BaseException) -> bool:
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+    return isinstance(e, (APIConnectionError, InternalServerError, RateLimitError))
+
+def log_retry(retry_state):
+    logger.warning("Transient API error, retrying (attempt %s): %s", retry_state.attempt_number, retry_state.outcome.exception())
 
+with_retries = retry(
+    wait=wait_exponential_jitter(initial=1, max=8),
+    stop=stop_after_attempt(4),
+    retry=retry_if_exception(is_transient_error),
+    before_sleep=log_retry,
+    reraise=True,
+)
+
+COLORS = {"red": 31, "green": 32, "yellow": 33, "blue": 34}
+
+def echo(message: str = "", nl: bool = True, err: bool = False):
+    stream = sys.stderr if err else sys.stdout
+    stream.write(message + ("\n" if nl else ""))
+    stream.flush()
+
+def secho(message: str, fg: str | None = None, nl: bool = True, err: bool = False):
+    stream = sys.stderr if err else sys.stdout
+    if fg and stream.isatty():
+        message = f"\033[{COLORS[fg]}m{message}\033[0m"
+    echo(message, nl=nl, err=err)
+
+def confirm(text: str, default: bool = True) -> bool:
+    suffix = " [Y/n]: " if default else " [y/N]: "
+    while True:
+        try:
+            answer = input(text + suffix).strip().lower()
+        except EOFError:
+            echo()
+            return False
+        if not answer:
+            return default
+        if answer in ("y", "yes"):
+            return True
+        if answer in ("n", "no"):
+            return False
+        echo("Error: invalid input")
 
-# Template to convert natural language to git commands
-PROMPT_TEMPLATE = """
+
+# System prompt to convert natural language to git commands
+SYSTEM_PROMPT = """
 You are a CLI assistant that translates natural-language Git instructions into exact shell commands.
-You must only return a JSON list of git commands, e.g., ["git status"].
+You must only return a JSON object on a single line with a "commands" list of git commands, e.g., {"commands": ["git status"]}.
 Do not include any explanations, markdown, or plain text.
 
 Use safe and common defaults when details are missing.
 
-When the user mentions "commit" or asks to "save changes" in any way, always use the special "__auto_commit__" command to ensure proper conventional commit messages are generated.
+Whenever the user asks to commit or save changes in any way, use the special "__auto_commit__" command instead of git add/commit.
 
 Examples:
 NL: "go back 2 commits"
-CMD: ["git revert HEAD~2"]
+CMD: {"commands": ["git revert HEAD~2"]}
 
 NL: "create a new branch called feature-x"
-CMD: ["git checkout -b feature-x"]
+CMD: {"commands": ["git checkout -b feature-x"]}
 
 NL: "switch to main"
-CMD: ["git checkout main"]
+CMD: {"commands": ["git checkout main"]}
 
 NL: "rename current branch to release-1.2"
-CMD: ["git branch -m release-1.2"]
+CMD: {"commands": ["git branch -m release-1.2"]}
 
 NL: "reset to origin/main"
-CMD: ["git reset --hard origin/main"]
-
-NL: "stage and commit with conventional message"
-CMD: ["__auto_commit__"]
+CMD: {"commands": ["git reset --hard origin/main"]}
 
 NL: "commit my changes"
-CMD: ["__auto_commit__"]
+CMD: {"commands": ["__auto_commit__"]}
 
 NL: "save my work"
-CMD: ["__auto_commit__"]
-
-NL: "commit the changes I made to the login page"
-CMD: ["__auto_commit__"]
-
-NL: "{query}"
-CMD:
+CMD: {"commands": ["__auto_commit__"]}
 """
 
-# Template for generating conventional commit messages
-CONVENTIONAL_COMMIT_PROMPT = """
+# User message for a natural language instruction
+PROMPT_TEMPLATE = """NL: "{query}"
+CMD:"""
+
+# System prompt for generating conventional commit messages
+COMMIT_SYSTEM_PROMPT = """
 You're a helpful assistant that writes Git commit messages using the Conventional Commits specification:
 https://www.conventionalcommits.org/
 
@@ -72,192 +148,954 @@ Example:
 Changes:
 - Modified login form to add password strength meter
 Commit: feat(auth): add password strength meter to login form
+"""
 
-Now write the commit message based on this diff:
+# User message carrying the diff to describe
+CONVENTIONAL_COMMIT_PROMPT = """Now write the commit message based on this diff:
 {diff}
-Commit:
-"""
+Commit:"""
+
+# Each template has a single placeholder, so split once and concatenate per call
+ASK_PREFIX, ASK_SUFFIX = PROMPT_TEMPLATE.split("{query}")
+COMMIT_PREFIX, COMMIT_SUFFIX = CONVENTIONAL_COMMIT_PROMPT.split("{diff}")
+
+DEFAULT_MODEL = "gpt-4o-mini"
+
+SPINNER_FRAMES = "|/-\\"
+
+def chat_messages(system: str, user: str) -> list[dict]:
+    return [
+        {"role": "system", "content": system},
+        {"role": "user", "content": user},
+    ]
+
+# A chat model that can turn a system prompt and user message into text
+class LLMBackend(Protocol):
+    model: str
+
+    # Stream a completion, passing each text chunk to on_text, and return the full text
+    def complete(self, system: str, user: str, on_text=None, *, max_tokens: int,
+                 temperature: float, stop: list[str], json_mode: bool = False) -> str: ...
+
+    # Get the model ready to answer so the first real request is fast
+    def warm_up(self): ...
+
+class OpenAIBackend:
+    def __init__(self, model: str):
+        self.model = model
+
+    # Only opening the stream is retried: errors surface before any text is echoed,
+    # so a retry never shows part of a response twice
+    @with_retries
+    def open_stream(self, **kwargs):
+        return get_retrying_client().chat.completions.create(model=self.model, stream=True, **kwargs)
+
+    def complete(self, system: str, user: str, on_text=None, *, max_tokens: int,
+                 temperature: float, stop: list[str], json_mode: bool = False) -> str:
+        response = self.open_stream(
+            messages=chat_messages(system, user),
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stop=stop,
+            response_format={"type": "json_object"} if json_mode else {"type": "text"})
+        chunks = []
+        for chunk in response:
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            chunks.append(chunk.choices[0].delta.content)
+            if on_text:
+                on_text(chunk.choices[0].delta.content)
+        return "".join(chunks).strip()
+
+    def warm_up(self):
+        # Opens the pooled connection so the next request skips DNS and TLS setup
+        get_client().with_options(timeout=3.0).models.retrieve(self.model)
+
+class OllamaBackend:
+    def __init__(self, model: str):
+        import ollama
+        self.ollama = ollama
+        self.model = model
+
+    def complete(self, system: str, user: str, on_text=None, *, max_tokens: int,
+                 temperature: float, stop: list[str], json_mode: bool = False) -> str:
+        response = self.ollama.chat(
+            model=self.model,
+            messages=chat_messages(system, user),
+            format="json" if json_mode else "",
+            options={"num_predict": max_tokens, "temperature": temperature, "stop": stop},
+            stream=True)
+        chunks = []
+        for chunk in response:
+            text = chunk["message"]["content"]
+            if not text:
+                continue
+            chunks.append(text)
+            if on_text:
+                on_text(text)
+        return "".join(chunks).strip()
+
+    def warm_up(self):
+        # A request without a prompt just loads the model into memory
+        self.ollama.generate(model=self.model)
+
+# "ollama:<name>" selects a local Ollama model, anything else is an OpenAI model
+def get_backend(name: str) -> LLMBackend:
+    if name.startswith("ollama:"):
+        return OllamaBackend(name.removeprefix("ollama:"))
+    return OpenAIBackend(name)
+
+backend: LLMBackend = OpenAIBackend(DEFAULT_MODEL)
+
+# On-disk cache of natural language -> generated commands
+CACHE_DIR = Path(os.getenv("XDG_CACHE_HOME", "~/.cache")).expanduser() / "git-ai"
+PROMPT_CACHE_PATH = CACHE_DIR / "prompt_cache.json"
+
+def load_prompt_cache() -> dict:
+    try:
+        with open(PROMPT_CACHE_PATH, encoding="utf-8") as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+prompt_cache = load_prompt_cache()
+
+# GIT_AI_NO_CACHE=1 neither reads nor writes the prompt caches
+def cache_enabled() -> bool:
+    return os.getenv("GIT_AI_NO_CACHE") != "1"
+
+# Different models can answer the same request differently, so the model is part of the key
+def prompt_cache_key(nl_text: str) -> str:
+    return hashlib.blake2b(f"{backend.model}\0{nl_text.strip().lower()}".encode()).hexdigest()
+
+def save_prompt_cache(key: str, commands: list[str]):
+    prompt_cache[key] = commands
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        with open(PROMPT_CACHE_PATH, "a+", encoding="utf-8") as f:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            # Merge with entries written by other processes since we loaded
+            f.seek(0)
+            try:
+                on_disk = json.load(f)
+            except ValueError:
+                on_disk = {}
+            if isinstance(on_disk, dict):
+                on_disk.update(prompt_cache)
+                prompt_cache.update(on_disk)
+            f.seek(0)
+            f.truncate()
+            json.dump(prompt_cache, f)
+    except OSError as e:
+        logger.warning("Could not write prompt cache: %s", e)
 
-model = "gpt-4o-mini"
+# Embedding-similarity cache so rephrasings of a known request skip the completion
+embedding_model = "text-embedding-3-small"
+SEMANTIC_CACHE_PATH = CACHE_DIR / "semcache.pkl"
+SEMANTIC_CACHE_THRESHOLD = 0.93
+SEMANTIC_CACHE_SIZE = 256
+
+# A stale or foreign cache file (other embedding size, mismatched lists) is treated as empty
+def load_semantic_cache(dim: int) -> tuple["np.ndarray | None", list[list[str]], list[str]]:
+    import numpy as np
+    try:
+        with open(SEMANTIC_CACHE_PATH, "rb") as f:
+            data = pickle.load(f)
+        embeddings, commands, models = data["embeddings"], data["commands"], data["models"]
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError, TypeError, AttributeError, ImportError, ValueError):
+        return None, [], []
+    if (not isinstance(embeddings, np.ndarray) or embeddings.ndim != 2 or embeddings.shape[1] != dim
+            or not isinstance(commands, list) or not isinstance(models, list)
+            or not len(embeddings) == len(commands) == len(models)):
+        logger.warning("Ignoring semantic cache with unexpected contents: %s", SEMANTIC_CACHE_PATH)
+        return None, [], []
+    return embeddings, commands, models
+
+def save_semantic_cache(embeddings: "np.ndarray", commands: list[list[str]], models: list[str]):
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        tmp_path = SEMANTIC_CACHE_PATH.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"embeddings": embeddings, "commands": commands, "models": models}, f)
+        os.replace(tmp_path, SEMANTIC_CACHE_PATH)
+    except OSError as e:
+        logger.warning("Could not write semantic cache: %s", e)
+
+# Memoized so remembering a confirmed answer reuses the lookup's embedding
+@functools.lru_cache(maxsize=8)
+def embed(nl_text: str) -> "np.ndarray | None":
+    import numpy as np
+    try:
+        response = get_client().embeddings.create(model=embedding_model, input=nl_text)
+    except Exception as e:
+        logger.warning("Could not embed prompt, skipping semantic cache: %s", e)
+        return None
+    vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+# Refs, branch names and counts the commands were built from; HEAD is implied by "last commit" and friends
+def command_arguments(commands: list[str]) -> set[str]:
+    arguments = set()
+    for cmd in commands:
+        try:
+            parts = shlex.split(cmd)
+        except ValueError:
+            parts = cmd.split()
+        skip = 2 if parts[:1] == ["git"] else 1
+        for part in parts[skip:]:
+            if not part.startswith("-"):
+                arguments.update(re.findall(r"[a-z0-9_]+", part.lower()))
+    arguments.discard("head")
+    return arguments
+
+# Short git phrases that differ only by a branch or ref embed almost identically,
+# so a hit is only accepted when the request mentions every argument of the cached commands
+def arguments_match(nl_text: str, commands: list[str]) -> bool:
+    words = set(re.findall(r"[a-z0-9_]+", nl_text.lower()))
+    return command_arguments(commands) <= words
+
+def semantic_cache_lookup(vector: "np.ndarray", nl_text: str) -> list[str] | None:
+    import numpy as np
+    embeddings, commands, models = load_semantic_cache(vector.shape[0])
+    if embeddings is None or not len(commands):
+        return None
+    sims = embeddings @ vector
+    # Only answers from the selected model count
+    sims[np.asarray(models) != backend.model] = -1.0
+    candidates = [int(i) for i in np.argsort(-sims) if sims[i] >= SEMANTIC_CACHE_THRESHOLD]
+    logger.debug("Closest semantic cache entry has similarity %.3f", sims.max())
+    best = next((i for i in candidates if arguments_match(nl_text, commands[i])), None)
+    if best is None:
+        return None
+
+    # Move the hit to the end so eviction drops the least recently used entries
+    order = [i for i in range(len(commands)) if i != best] + [best]
+    save_semantic_cache(embeddings[order], [commands[i] for i in order], [models[i] for i in order])
+    return commands[best]
+
+def semantic_cache_store(vector: "np.ndarray", new_commands: list[str]):
+    import numpy as np
+    embeddings, commands, models = load_semantic_cache(vector.shape[0])
+    if embeddings is None:
+        embeddings = vector[np.newaxis, :]
+    else:
+        embeddings = np.vstack([embeddings, vector])
+    commands = commands + [new_commands]
+    models = models + [backend.model]
+    save_semantic_cache(embeddings[-SEMANTIC_CACHE_SIZE:], commands[-SEMANTIC_CACHE_SIZE:], models[-SEMANTIC_CACHE_SIZE:])
+
+# Cache commands only once the user has confirmed them, so rejected answers are never replayed
+def remember_commands(nl_text: str, commands: list[str]):
+    if not commands or not cache_enabled() or match_fast_path(nl_text) is not None:
+        return
+    key = prompt_cache_key(nl_text)
+    if prompt_cache.get(key) == commands:
+        return
+    save_prompt_cache(key, commands)
+    # Embeddings come from OpenAI, so the semantic cache is skipped for local models
+    if isinstance(backend, OpenAIBackend):
+        vector = embed(nl_text)
+        if vector is not None and semantic_cache_lookup(vector, nl_text) != commands:
+            semantic_cache_store(vector, commands)
+
+# Requests simple enough to answer without a model; a callable builds commands from the match
+FAST_PATHS = [
+    (re.compile(r"^\s*(?:show\s+)?(?:git\s+)?status\s*$", re.I), ["git status"]),
+    (re.compile(r"^\s*(?:show\s+)?(?:the\s+)?(?:git\s+)?log\s*$", re.I), ["git log"]),
+    (re.compile(r"^\s*(?:show\s+)?(?:the\s+)?(?:git\s+)?diff\s*$", re.I), ["git diff"]),
+    (re.compile(r"^\s*(?:git\s+)?pull\s*$", re.I), ["git pull"]),
+    (re.compile(r"^\s*(?:git\s+)?push\s*$", re.I), ["git push"]),
+    (re.compile(r"^\s*(?:git\s+)?fetch\s*$", re.I), ["git fetch"]),
+    (re.compile(r"^\s*(?:switch\s+to|checkout|go\s+to)\s+([^\s-]\S*)\s*$", re.I),
+     lambda m: [f"git checkout {m.group(1)}"]),
+    (re.compile(r"^\s*(?:create|make|new)(?:\s+a)?(?:\s+new)?\s+branch(?:\s+(?:called|named))?\s+([^\s-]\S*)\s*$", re.I),
+     lambda m: [f"git checkout -b {m.group(1)}"]),
+    (re.compile(r"^\s*(?:commit|save)(?:\s+(?:my|the|all))?(?:\s+(?:changes|work))?\s*$", re.I), ["__auto_commit__"]),
+]
+
+# Accept {"commands": [...]} or a bare list, recovering the list from stray surrounding tokens
+def parse_commands(text: str) -> list[str]:
+    try:
+        data = orjson.loads(text)
+    except orjson.JSONDecodeError:
+        start, end = text.find("["), text.rfind("]") + 1
+        if start < 0 or end <= start:
+            raise
+        logger.debug("Recovering command list from malformed response: %s", text)
+        data = orjson.loads(text[start:end])
+    if isinstance(data, dict):
+        data = data.get("commands", [])
+    if not isinstance(data, list) or not all(isinstance(cmd, str) for cmd in data):
+        raise ValueError(f"Expected a list of commands, got: {text}")
+    return data
+
+def match_fast_path(nl_text: str) -> list[str] | None:
+    for pattern, commands in FAST_PATHS:
+        match = pattern.match(nl_text)
+        if match:
+            return commands(match) if callable(commands) else list(commands)
+    return None
 
 def ask_llm(nl_text: str) -> list[str]:
-    prompt = PROMPT_TEMPLATE.format(query=nl_text)
-    logger.info(f"Sending prompt to LLM: '{nl_text}'")
+    commands = match_fast_path(nl_text)
+    if commands:
+        logger.info("Matched fast path for '%s': %s", nl_text, commands)
+        return commands
+
+    if cache_enabled():
+        cached = prompt_cache.get(prompt_cache_key(nl_text))
+        if cached:
+            logger.info("Using cached commands for '%s': %s", nl_text, cached)
+            return cached
+
+        # Embeddings come from OpenAI, so the semantic cache is skipped for local models
+        vector = embed(nl_text) if isinstance(backend, OpenAIBackend) else None
+        if vector is not None:
+            cached = semantic_cache_lookup(vector, nl_text)
+            if cached:
+                logger.info("Using semantically cached commands for '%s': %s", nl_text, cached)
+                return cached
+
+    prompt = ASK_PREFIX + nl_text + ASK_SUFFIX
+    logger.info("Sending prompt to LLM: '%s'", nl_text)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Prompt size: %s tokens", ask_template_tokens() + count_tokens(nl_text))
     try:
-        response = client.completions.create(model=model,
-            prompt=prompt,
-            max_tokens=150,
-            temperature=0,
-            stop=["\n"])
-        logger.debug(f"LLM response: {response.choices[0].text.strip()}")
-        commands = json.loads(response.choices[0].text.strip())
-        logger.info(f"LLM generated commands: {commands}")
+        # The JSON is only usable once complete, so just show progress while it streams
+        frames = itertools.cycle(SPINNER_FRAMES)
+        show_spinner = sys.stderr.isatty()
+        def spin(_text):
+            if show_spinner:
+                echo(f"\r{next(frames)} Thinking...", err=True, nl=False)
+        try:
+            text = backend.complete(SYSTEM_PROMPT, prompt, on_text=spin,
+                max_tokens=80,
+                temperature=0,
+                stop=["\n", "]\n"],
+                json_mode=True)
+        finally:
+            if show_spinner:
+                echo("\r\033[K", err=True, nl=False)
+        logger.debug("LLM response: %s", text)
+        commands = parse_commands(text)
+        logger.info("LLM generated commands: %s", commands)
         return commands
     except Exception as e:
-        error_msg = f"Error from OpenAI: {e}"
+        error_msg = f"Error from {backend.model}: {e}"
         logger.error(error_msg)
-        click.secho(error_msg, fg="red")
+        secho(error_msg, fg="red")
         return []
 
-def get_git_diff_summary() -> str:
-    logger.info("Retrieving git diff summary for staged changes")
-    try:
-        # Get file status (added, modified, deleted)
-        status_result = subprocess.run(
-            ["git", "diff", "--cached", "--name-status"],
+# What get_git_diff_summary returns when nothing is staged
+EMPTY_DIFF_SUMMARY = "Files changed:\n\n\nDetails:\n"
+
+# Runs git commands; created once so the executable and environment are resolved once
+class GitClient:
+    def __init__(self):
+        self.executable = shutil.which("git") or "git"
+        self.env = dict(os.environ)
+        # Read-only commands must not take the index lock or rewrite the index
+        self.read_only_env = {**self.env, "GIT_OPTIONAL_LOCKS": "0"}
+
+    def command_env(self, read_only: bool, extra_env: dict | None) -> dict:
+        env = self.read_only_env if read_only else self.env
+        return {**env, **extra_env} if extra_env else env
+
+    def run(self, *args: str, read_only: bool = False, cwd: str | None = None, extra_env: dict | None = None) -> str:
+        result = subprocess.run(
+            [self.executable, *args],
+            cwd=cwd,
             capture_output=True,
-            text=True,
+            encoding="utf-8",
+            errors="replace",
+            env=self.command_env(read_only, extra_env),
             check=True
         )
+        return result.stdout
 
-        # Get actual content diff for better context
-        diff_result = subprocess.run(
-            ["git", "diff", "--cached"],
-            capture_output=True,
-            text=True,
-            check=True
+    async def run_async(self, *args: str, read_only: bool = False, cwd: str | None = None,
+                        extra_env: dict | None = None) -> str:
+        import asyncio
+        process = await asyncio.create_subprocess_exec(
+            self.executable, *args,
+            cwd=cwd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=self.command_env(read_only, extra_env)
         )
+        stdout, stderr = await process.communicate()
+        stdout = stdout.decode("utf-8", errors="replace")
+        stderr = stderr.decode("utf-8", errors="replace")
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, ["git", *args], stdout, stderr)
+        return stdout
+
+git_client = GitClient()
+
+def warm_up_enabled() -> bool:
+    return os.getenv("GIT_AI_NO_WARMUP") != "1"
+
+def warm_up():
+    try:
+        backend.warm_up()
+    except Exception as e:
+        logger.debug("Connection warm-up failed: %s", e)
+
+warm_up_thread = None
+
+# Warm the backend in the background while caches load and git runs; GIT_AI_NO_WARMUP=1 disables it
+def start_warm_up():
+    global warm_up_thread
+    if warm_up_thread is None and warm_up_enabled():
+        warm_up_thread = threading.Thread(target=warm_up, daemon=True)
+        warm_up_thread.start()
+
+async def stage_and_diff(cwd: str | None = None) -> str:
+    logger.info("Staging all changes with 'git add .'")
+    await git_client.run_async("add", ".", cwd=cwd)
+    return await get_git_diff_summary(cwd=cwd)
 
-        # Combine both for better context
-        combined_diff = f"Files changed:\n{status_result.stdout.strip()}\n\nDetails:\n{diff_result.stdout.strip()}"
-        logger.info(f"Retrieved diff summary: {len(combined_diff)} characters")
+# Stage and diff while the API connection for the commit message is being opened;
+# the warm-up runs in the background so the git work never waits on it
+async def prepare_commit() -> str:
+    start_warm_up()
+    return await stage_and_diff()
+
+# Preview the changes `git add .` would commit while the API connection is being opened
+async def preview_commit() -> str:
+    start_warm_up()
+    return await get_preview_diff_summary()
+
+# Turn `git diff --raw -p` output into the "Files changed/Details" summary
+def summarize_diff(output: str) -> str:
+    header, _, details = output.partition("\ndiff --git ")
+    if details:
+        details = "diff --git " + details
+
+    # Reduce ":<modes> <shas> <status>\t<path>" raw lines to name-status form
+    status = [line.split(" ", 4)[-1] for line in header.splitlines() if line.startswith(":")]
+
+    # Combine both for better context
+    summary = "Files changed:\n{}\n\nDetails:\n".format("\n".join(status))
+    budget = MAX_COMMIT_PROMPT_TOKENS - commit_template_tokens() - count_tokens(summary)
+    return summary + truncate_details(details.strip(), budget)
+
+# Token budget for the whole commit message prompt, and a per-file cap on patch lines
+MAX_COMMIT_PROMPT_TOKENS = 3200
+MAX_FILE_DIFF_LINES = 200
+
+@functools.cache
+def get_encoding():
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(DEFAULT_MODEL)
+    except Exception as e:
+        # Unknown models or no network to fetch the encoding: fall back to an estimate
+        logger.debug("tiktoken unavailable, estimating token counts: %s", e)
+        return None
+
+def count_tokens(text: str) -> int:
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+# The templates never change, so count their tokens once; only the variable text is encoded per call
+@functools.cache
+def ask_template_tokens() -> int:
+    return count_tokens(SYSTEM_PROMPT) + count_tokens(ASK_PREFIX + ASK_SUFFIX)
+
+@functools.cache
+def commit_template_tokens() -> int:
+    return count_tokens(COMMIT_SYSTEM_PROMPT) + count_tokens(COMMIT_PREFIX + COMMIT_SUFFIX)
+
+# Keep each file's patch, capped at MAX_FILE_DIFF_LINES lines, while it fits in the budget
+def truncate_details(details: str, budget: int) -> str:
+    if not details or count_tokens(details) <= budget:
+        return details
+
+    files = ["diff --git " + part for part in details.split("\ndiff --git ")]
+    files[0] = files[0].removeprefix("diff --git ")
+    kept = []
+    omitted = 0
+    for file_diff in files:
+        lines = file_diff.splitlines()
+        if len(lines) > MAX_FILE_DIFF_LINES:
+            file_diff = "\n".join(lines[:MAX_FILE_DIFF_LINES]) + f"\n... [{len(lines) - MAX_FILE_DIFF_LINES} more lines]"
+        tokens = count_tokens(file_diff)
+        if tokens > budget:
+            omitted += 1
+            continue
+        kept.append(file_diff)
+        budget -= tokens
+    if omitted:
+        kept.append(f"... [truncated {omitted} files]")
+    return "\n".join(kept)
+
+async def get_git_diff_summary(cwd: str | None = None) -> str:
+    logger.info("Retrieving git diff summary for staged changes")
+    try:
+        # Single call: raw status lines come first, then the patch
+        output = await git_client.run_async("diff", "--cached", "--raw", "-p", read_only=True, cwd=cwd)
+        combined_diff = summarize_diff(output)
+        logger.info("Retrieved diff summary: %s characters", len(combined_diff))
         return combined_diff
-    except subprocess.CalledProcessError as e:
+    except (subprocess.CalledProcessError, OSError) as e:
+        error_msg = f"Could not retrieve diff: {e}"
+        logger.error(error_msg)
+        return error_msg
+
+# Summarize exactly what `git add .` followed by `git commit` would commit, by staging
+# into a copy of the index so the real one is left untouched until the user confirms
+async def get_preview_diff_summary() -> str:
+    logger.info("Retrieving git diff summary for the commit preview")
+    try:
+        index_path = (await git_client.run_async("rev-parse", "--git-path", "index", read_only=True)).strip()
+        with tempfile.TemporaryDirectory(prefix="git-ai-") as tmp_dir:
+            preview_index = os.path.join(tmp_dir, "index")
+            if os.path.exists(index_path):
+                shutil.copyfile(index_path, preview_index)
+            preview_env = {"GIT_INDEX_FILE": preview_index}
+            await git_client.run_async("add", ".", extra_env=preview_env)
+            output = await git_client.run_async("diff", "--cached", "--raw", "-p", extra_env=preview_env)
+        combined_diff = summarize_diff(output)
+        logger.info("Retrieved diff summary: %s characters", len(combined_diff))
+        return combined_diff
+    except (subprocess.CalledProcessError, OSError) as e:
         error_msg = f"Could not retrieve diff: {e}"
         logger.error(error_msg)
         return error_msg
 
+COMMIT_OPTIONS = {
+    "max_tokens": 32,  # A conventional commit subject line is well under this
+    "temperature": 0.3,
+    "stop": ["\n", "\n\n"],
+}
+
+def validate_commit_message(message: str) -> str:
+    # Validate the message matches conventional format
+    if not any(message.startswith(prefix) for prefix in ["feat", "fix", "chore", "docs", "refactor", "test", "perf", "ci", "build", "style"]):
+        logger.warning("Generated message '%s' doesn't follow conventional format, applying fallback", message)
+        return "chore: update files based on recent changes"
+    return message
+
 def generate_commit_message(diff: str) -> str:
     logger.info("Generating conventional commit message based on diff")
 
     if not diff or diff.startswith("Could not retrieve diff"):
         logger.warning("No meaningful diff available for commit message generation")
-        return "chore: update files"
+        message = "chore: update files"
+        secho(f"Commit message: {message}", fg="blue")
+        return message
 
-    prompt = CONVENTIONAL_COMMIT_PROMPT.format(diff=diff)
+    prompt = COMMIT_PREFIX + diff + COMMIT_SUFFIX
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Prompt size: %s tokens", commit_template_tokens() + count_tokens(diff))
     try:
-        response = client.completions.create(model=model,
-        prompt=prompt,
-        max_tokens=100,  # Increased for more detailed messages
-        temperature=0.3,
-        stop=["\n"])
-
-        message = response.choices[0].text.strip()
-        logger.info(f"Generated commit message: '{message}'")
-
-        # Validate the message matches conventional format
-        if not any(message.startswith(prefix) for prefix in ["feat", "fix", "chore", "docs", "refactor", "test", "perf", "ci", "build", "style"]):
-            logger.warning(f"Generated message '{message}' doesn't follow conventional format, applying fallback")
-            message = "chore: update files based on recent changes"
-
-        return message
+        # Show the message as it is generated
+        secho("Commit message: ", fg="blue", nl=False)
+        message = backend.complete(COMMIT_SYSTEM_PROMPT, prompt,
+            on_text=lambda text: echo(text, nl=False),
+            **COMMIT_OPTIONS)
+        echo()
+        logger.info("Generated commit message: '%s'", message)
+        validated = validate_commit_message(message)
+        # The streamed text is not what gets committed, so say what will be
+        if validated != message:
+            secho(f"Not a conventional commit message, using instead: {validated}", fg="yellow")
+        return validated
     except Exception as e:
         error_msg = f"Error generating commit message: {e}"
         logger.error(error_msg)
-        click.secho(error_msg, fg="red")
-        return "chore: update project files"
+        secho(error_msg, fg="red")
+        message = "chore: update project files"
+        secho(f"Using fallback commit message: {message}", fg="yellow")
+        return message
 
-def run_commands(commands: list[str], pre_generated_message=None):
+# Verbs that only read the repository; branch counts only when it just lists branches
+READ_ONLY_GIT_VERBS = {"status", "log", "diff", "show", "branch"}
+
+def is_read_only_git(args: list[str]) -> bool:
+    if not args or args[0] not in READ_ONLY_GIT_VERBS:
+        return False
+    return args[0] != "branch" or len(args) == 1
+
+def run_commands(commands: list[str], precomputed_message: str | None = None, precomputed_diff: str | None = None):
     for cmd in commands:
         if cmd == "__auto_commit__":
+            import asyncio
             logger.info("Executing auto-commit workflow")
-            perform_auto_commit(pre_generated_message)
+            asyncio.run(perform_auto_commit(precomputed_message, precomputed_diff))
             continue
 
-        click.secho(f"Running: {cmd}", fg="green")
-        logger.info(f"Executing git command: '{cmd}'")
+        secho(f"Running: {cmd}", fg="green")
+        logger.info("Executing git command: '%s'", cmd)
         try:
-            result = subprocess.run(cmd.split(), check=True, capture_output=True, text=True)
-            if result.stdout:
-                logger.debug(f"Command output: {result.stdout}")
+            parts = shlex.split(cmd)
+            if not parts:
+                msg = f"Skipping empty command '{cmd}'"
+                logger.warning(msg)
+                secho(msg, fg="yellow")
+                continue
+            if parts[0] == "git":
+                output = git_client.run(*parts[1:], read_only=is_read_only_git(parts[1:]))
+            else:
+                output = subprocess.run(parts, check=True, capture_output=True, text=True).stdout
+            if output:
+                logger.debug("Command output: %s", output)
+        except ValueError as e:
+            error_msg = f"Could not parse command '{cmd}': {e}"
+            logger.error(error_msg)
+            secho(error_msg, fg="red")
         except subprocess.CalledProcessError as e:
             error_msg = f"Command failed: {e}\nOutput: {e.stderr}"
             logger.error(error_msg)
-            click.secho(error_msg, fg="red")
+            secho(error_msg, fg="red")
+        except OSError as e:
+            error_msg = f"Could not run command '{cmd}': {e}"
+            logger.error(error_msg)
+            secho(error_msg, fg="red")
 
-def perform_auto_commit(pre_generated_message=None):
+async def perform_auto_commit(precomputed_message: str | None = None, precomputed_diff: str | None = None):
     logger.info("Starting auto-commit process")
     try:
-        # Stage all changes
-        logger.info("Staging all changes with 'git add .'")
-        subprocess.run(["git", "add", "."], check=True, capture_output=True, text=True)
+        if precomputed_diff is not None:
+            # The preview diffed a copy of the index; stage for real now that the user confirmed
+            diff = precomputed_diff
+            if diff != EMPTY_DIFF_SUMMARY:
+                logger.info("Staging all changes with 'git add .'")
+                await git_client.run_async("add", ".")
+        elif precomputed_message:
+            diff = await stage_and_diff()
+        else:
+            # Stage all changes and get a comprehensive diff for commit message generation
+            diff = await prepare_commit()
 
-        # Get comprehensive diff for better commit message generation
-        diff = get_git_diff_summary()
-        if not diff or diff == "Files changed:\n\nDetails:\n":
+        if not diff or diff == EMPTY_DIFF_SUMMARY:
             msg = "No staged changes to commit."
             logger.warning(msg)
-            click.secho(msg, fg="yellow")
+            secho(msg, fg="yellow")
             return
 
         # Use pre-generated message or generate a new one
-        if pre_generated_message:
-            message = pre_generated_message
-            logger.info(f"Using pre-generated commit message: '{message}'")
+        if precomputed_message:
+            message = precomputed_message
+            logger.info("Using pre-generated commit message: '%s'", message)
         else:
             # Generate a meaningful commit message
             message = generate_commit_message(diff)
-            click.echo(f"Generated commit message: {message}")
 
         # Perform the commit
-        logger.info(f"Committing changes with message: '{message}'")
-        result = subprocess.run(["git", "commit", "-m", message], check=True, capture_output=True, text=True)
-        click.secho(f"Successfully committed changes: {result.stdout}", fg="green")
+        logger.info("Committing changes with message: '%s'", message)
+        output = await git_client.run_async("commit", "-m", message)
+        secho(f"Successfully committed changes: {output}", fg="green")
         logger.info("Commit completed successfully")
     except subprocess.CalledProcessError as e:
         error_msg = f"Commit failed: {e}\nOutput: {e.stderr}"
         logger.error(error_msg)
-        click.secho(error_msg, fg="red")
+        secho(error_msg, fg="red")
+
+parser = argparse.ArgumentParser(prog="git-ai", description="Run Git commands using natural language")
+parser.add_argument("nl_command", nargs="*", help="What to do, in plain words")
+parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging")
+parser.add_argument("--model", "-m", default=os.getenv("GIT_AI_MODEL", DEFAULT_MODEL),
+                    help="OpenAI model, or ollama:<name> for a local Ollama model (default: %(default)s)")
+
+batch_parser = argparse.ArgumentParser(
+    prog="git-ai batch-commit",
+    description="Generate and apply commit messages for many repositories through the OpenAI Batch API")
+batch_parser.add_argument("path", help='JSONL file with one {"repo": <path>, "diff": <optional diff>} object per line')
+batch_parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging")
+batch_parser.add_argument("--model", "-m", default=os.getenv("GIT_AI_MODEL", DEFAULT_MODEL),
+                          help="OpenAI model (default: %(default)s)")
+batch_parser.add_argument("--resume", metavar="BATCH_ID",
+                          help="Wait for an already submitted batch instead of submitting a new one")
+
+bulk_parser = argparse.ArgumentParser(
+    prog="git-ai bulk-commit",
+    description="Stage and commit all changes in several repositories, generating the messages concurrently")
+bulk_parser.add_argument("--repos", nargs="+", required=True, help="Repository paths")
+bulk_parser.add_argument("--verbose", "-v", action="store_true", help="Enable verbose logging")
+bulk_parser.add_argument("--model", "-m", default=os.getenv("GIT_AI_MODEL", DEFAULT_MODEL),
+                         help="OpenAI model, or ollama:<name> for a local Ollama model (default: %(default)s)")
+
+BATCH_POLL_SECONDS = 30
+# Upper bound on commit message requests in flight at once
+BULK_CONCURRENCY = 8
+BATCH_FINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+def setup(arg_parser: argparse.ArgumentParser, args: argparse.Namespace):
+    global backend
+    try:
+        backend = get_backend(args.model)
+    except ImportError:
+        arg_parser.error("Ollama models need the ollama package: pip install 'git-ai[ollama]'")
 
-@click.command()
-@click.argument("nl_command", nargs=-1)
-@click.option("--verbose", "-v", is_flag=True, help="Enable verbose logging")
-def main(nl_command, verbose):
-    """Run Git commands using natural language"""
     # Configure logging level based on verbosity
-    if verbose:
+    if args.verbose:
         logger.setLevel(logging.DEBUG)
         logger.debug("Verbose logging enabled")
 
+# Rows are keyed by their position in the file, so a resumed batch maps back to the same repos
+def read_batch_rows(path: str) -> dict[str, dict]:
+    rows = {}
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                row = orjson.loads(line)
+            except orjson.JSONDecodeError as e:
+                raise ValueError(f"{path}:{line_number}: invalid JSON: {e}")
+            if not isinstance(row, dict) or not isinstance(row.get("repo"), str):
+                raise ValueError(f'{path}:{line_number}: expected an object with a "repo" path')
+            if not os.path.isdir(row["repo"]):
+                raise ValueError(f"{path}:{line_number}: repo {row['repo']!r} is not a directory")
+            if not isinstance(row.get("diff", ""), str):
+                raise ValueError(f'{path}:{line_number}: "diff" must be a string')
+            rows[str(line_number)] = row
+    return rows
+
+# Fill in the staged diff for rows that don't carry one; supplied diffs get the same token budget
+async def fill_missing_diffs(rows: dict[str, dict]):
+    import asyncio
+    missing = [row for row in rows.values() if not row.get("diff")]
+    diffs = await asyncio.gather(*(get_git_diff_summary(cwd=row["repo"]) for row in missing))
+    for row, diff in zip(missing, diffs):
+        row["diff"] = diff
+    budget = MAX_COMMIT_PROMPT_TOKENS - commit_template_tokens()
+    for row in rows.values():
+        row["diff"] = truncate_details(row["diff"], budget)
+
+@with_retries
+def submit_commit_batch(rows: dict[str, dict]):
+    lines = [
+        orjson.dumps({
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": backend.model,
+                "messages": chat_messages(COMMIT_SYSTEM_PROMPT, COMMIT_PREFIX + row["diff"] + COMMIT_SUFFIX),
+                **COMMIT_OPTIONS,
+            },
+        })
+        for custom_id, row in rows.items()
+    ]
+    batch_file = get_retrying_client().files.create(file=("batch.jsonl", b"\n".join(lines)), purpose="batch")
+    batch = get_retrying_client().batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h")
+    logger.info("Created batch %s with %s requests", batch.id, len(rows))
+    return batch
+
+@with_retries
+def retrieve_batch(batch_id: str):
+    return get_retrying_client().batches.retrieve(batch_id)
+
+def wait_for_batch(batch):
+    while batch.status not in BATCH_FINAL_STATUSES:
+        echo(f"Batch {batch.id} is {batch.status}, checking again in {BATCH_POLL_SECONDS}s")
+        time.sleep(BATCH_POLL_SECONDS)
+        try:
+            batch = retrieve_batch(batch.id)
+        except Exception as e:
+            if not is_transient_error(e):
+                raise
+            # The batch keeps running server-side; keep polling through outages rather than orphan it
+            logger.warning("Could not check batch %s, will try again: %s", batch.id, e)
+    return batch
+
+@with_retries
+def download_batch_output(file_id: str) -> str:
+    return get_retrying_client().files.content(file_id).text
+
+# Map each request's custom_id to the generated message
+def read_batch_messages(batch) -> dict[str, str]:
+    messages = {}
+    for line in download_batch_output(batch.output_file_id).splitlines():
+        result = orjson.loads(line)
+        response = result.get("response") or {}
+        if response.get("status_code") != 200:
+            logger.error("Batch request %s failed: %s", result["custom_id"], result.get("error") or response)
+            continue
+        message = (response["body"]["choices"][0]["message"].get("content") or "").strip()
+        if not message:
+            logger.error("Batch request %s returned no commit message", result["custom_id"])
+            continue
+        messages[result["custom_id"]] = validate_commit_message(message)
+    return messages
+
+def commit_batch_results(messages: dict[str, str], rows: dict[str, dict]):
+    for custom_id, row in rows.items():
+        message = messages.get(custom_id)
+        if not message:
+            secho(f"No commit message generated for {row['repo']}", fg="yellow")
+            continue
+        try:
+            git_client.run("commit", "-m", message, cwd=row["repo"])
+            secho(f"Committed {row['repo']}: {message}", fg="green")
+        except (subprocess.CalledProcessError, OSError) as e:
+            error_msg = f"Commit failed in {row['repo']}: {e}\nOutput: {getattr(e, 'stderr', '')}"
+            logger.error(error_msg)
+            secho(error_msg, fg="red")
+
+def batch_commit(argv: list[str]):
+    import asyncio
+    args = batch_parser.parse_args(argv)
+    setup(batch_parser, args)
+    if not isinstance(backend, OpenAIBackend):
+        batch_parser.error("The Batch API needs an OpenAI model")
+
+    try:
+        rows = read_batch_rows(args.path)
+    except (OSError, ValueError) as e:
+        batch_parser.error(str(e))
+
+    batch_id = args.resume
+    try:
+        if batch_id:
+            batch = retrieve_batch(batch_id)
+        else:
+            asyncio.run(fill_missing_diffs(rows))
+            rows = {
+                custom_id: row for custom_id, row in rows.items()
+                if row["diff"] != EMPTY_DIFF_SUMMARY and not row["diff"].startswith("Could not retrieve diff")
+            }
+            if not rows:
+                echo("No changes to commit.")
+                return
+            batch = submit_commit_batch(rows)
+            batch_id = batch.id
+            echo(f"Submitted batch {batch_id}")
+
+        batch = wait_for_batch(batch)
+        if batch.status != "completed" or not batch.output_file_id:
+            secho(f"Batch {batch.id} ended as {batch.status}", fg="red")
+            return
+
+        messages = read_batch_messages(batch)
+        if args.resume:
+            # Rows without changes were never submitted; failed requests are logged above
+            rows = {custom_id: row for custom_id, row in rows.items() if custom_id in messages}
+        commit_batch_results(messages, rows)
+    except (Exception, KeyboardInterrupt) as e:
+        error_msg = f"Batch commit failed: {str(e) or type(e).__name__}"
+        logger.error(error_msg)
+        secho(error_msg, fg="red")
+        if batch_id:
+            secho(f"Resume with: git-ai batch-commit {args.path} --resume {batch_id}", fg="yellow")
+        sys.exit(1)
+
+# Generate commit messages for several diffs with up to BULK_CONCURRENCY requests in flight
+async def generate_many(diffs: list[str]) -> list[str]:
+    import asyncio
+    semaphore = asyncio.Semaphore(BULK_CONCURRENCY)
+
+    async def generate_one(diff: str) -> str:
+        async with semaphore:
+            try:
+                message = await asyncio.to_thread(
+                    backend.complete, COMMIT_SYSTEM_PROMPT, COMMIT_PREFIX + diff + COMMIT_SUFFIX, **COMMIT_OPTIONS)
+                return validate_commit_message(message)
+            except Exception as e:
+                logger.error("Error generating commit message: %s", e)
+                return "chore: update project files"
+
+    return await asyncio.gather(*(generate_one(diff) for diff in diffs))
+
+async def commit_repo(repo: str, message: str):
+    try:
+        await git_client.run_async("commit", "-m", message, cwd=repo)
+        secho(f"Committed {repo}: {message}", fg="green")
+    except subprocess.CalledProcessError as e:
+        error_msg = f"Commit failed in {repo}: {e}\nOutput: {e.stderr}"
+        logger.error(error_msg)
+        secho(error_msg, fg="red")
+
+async def bulk_commit_repos(repos: list[str]):
+    import asyncio
+    diffs = await asyncio.gather(*(stage_and_diff(cwd=repo) for repo in repos), return_exceptions=True)
+    changed = []
+    for repo, diff in zip(repos, diffs):
+        if isinstance(diff, Exception) or diff.startswith("Could not retrieve diff"):
+            secho(f"Could not stage changes in {repo}: {diff}", fg="red")
+        elif diff == EMPTY_DIFF_SUMMARY:
+            secho(f"No changes to commit in {repo}", fg="yellow")
+        else:
+            changed.append((repo, diff))
+    if not changed:
+        return
+
+    messages = await generate_many([diff for _, diff in changed])
+    await asyncio.gather(*(commit_repo(repo, message) for (repo, _), message in zip(changed, messages)))
+
+def bulk_commit(argv: list[str]):
+    import asyncio
+    args = bulk_parser.parse_args(argv)
+    setup(bulk_parser, args)
+    asyncio.run(bulk_commit_repos(args.repos))
+
+def main(argv: list[str] | None = None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["batch-commit"]:
+        return batch_commit(argv[1:])
+    if argv[:1] == ["bulk-commit"]:
+        return bulk_commit(argv[1:])
+
+    args = parser.parse_intermixed_args(argv)
+    nl_command = args.nl_command
+    setup(parser, args)
+
     logger.info("Starting git-ai CLI")
 
     if not nl_command:
         msg = "Please provide a natural language Git command."
         logger.warning(msg)
-        click.echo(msg)
+        echo(msg)
         return
 
     nl_text = " ".join(nl_command)
-    logger.info(f"Processing natural language command: '{nl_text}'")
+    logger.info("Processing natural language command: '%s'", nl_text)
+    # Fast-path requests never reach the model, so only warm up when one is likely needed
+    if match_fast_path(nl_text) is None:
+        start_warm_up()
     commands = ask_llm(nl_text)
 
     if not commands:
         msg = "No valid git commands could be generated."
         logger.warning(msg)
-        click.echo(msg)
+        echo(msg)
         return
 
-    pre_generated_message = None
+    precomputed_message = None
+    precomputed_diff = None
     if "__auto_commit__" in commands:
+        import asyncio
         logger.info("Auto-commit detected, pre-generating commit message for user preview")
-        # Stage files first to get the diff
+        # Nothing is staged until the user confirms
         try:
-            subprocess.run(["git", "add", "."], check=True, capture_output=True, text=True)
-            diff = get_git_diff_summary()
-            if diff and diff != "Files changed:\n\nDetails:\n":
-                pre_generated_message = generate_commit_message(diff)
-                click.secho(f"Will commit with message: '{pre_generated_message}'", fg="blue")
+            diff = asyncio.run(preview_commit())
+            if not diff.startswith("Could not retrieve diff"):
+                precomputed_diff = diff
+            if diff and diff != EMPTY_DIFF_SUMMARY:
+                # The message is streamed to the terminal as it is generated
+                precomputed_message = generate_commit_message(diff)
             else:
-                click.secho("No changes detected to commit.", fg="yellow")
+                secho("No changes detected to commit.", fg="yellow")
         except Exception as e:
-            logger.error(f"Error pre-generating commit message: {e}")
+            logger.error("Error pre-generating commit message: %s", e)
 
-    if click.confirm(f"Run these command(s)? {commands}", default=True):
-        logger.info(f"User confirmed execution of commands: {commands}")
-        run_commands(commands, pre_generated_message)
+    if confirm(f"Run these command(s)? {commands}", default=True):
+        logger.info("User confirmed execution of commands: %s", commands)
+        remember_commands(nl_text, commands)
+        run_commands(commands, precomputed_message, precomputed_diff)
     else:
         logger.info("User aborted command execution")
-        click.echo("Aborted.")
+        echo("Aborted.")
 
 if __name__ == "__main__":
     main()